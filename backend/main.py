@@ -5,6 +5,7 @@ Main API server for the Orbit semantic canvas.
 Endpoints:
   - POST /api/generate-card — Claude generates a card from raw input
   - POST /api/embed — Generate and store embedding for a card
+  - POST /api/embed/bulk — Embed many cards in the background (bulk import)
   - POST /api/gravity — Get similarity scores between cards
   - POST /api/magnet — Evaluate card relevance to a constraint
   - GET  /health — Health check with Redis/Claude status
@@ -14,17 +15,22 @@ import os
 import json
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
-from models.schemas import CardInput, GeneratedCard, EmbedRequest, EmbedResponse, GravityRequest, GravityResponse, SimilarityPair, MagnetRequest, MagnetResponse, MagnetResult, SuggestRequest, SuggestResponse, ExportRequest, ExportResponse
-from services import claude_service, embedding_service, redis_service
+from models.schemas import CardInput, GeneratedCard, EmbedRequest, EmbedResponse, BulkEmbedRequest, BulkEmbedResponse, GravityRequest, GravityResponse, SimilarityPair, MagnetRequest, MagnetResponse, MagnetResult, SuggestRequest, SuggestResponse, ExportRequest, ExportResponse
+from services import claude_service, embedding_service, local_embedder, redis_service
+from services.card_store import CardCache, CardStore
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"))
 
-# Store generated cards in memory for quick access (also in Redis)
-cards_store: dict[str, dict] = {}
+# Generated cards — bounded in-process LRU backed by Redis hashes
+cards_store = CardCache()
+
+# Normalized embeddings of cards embedded by this process — gravity's fast path
+card_vectors = CardStore()
 
 
 @asynccontextmanager
@@ -32,14 +38,17 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events."""
     # Try to connect to Redis and create index on startup
     try:
-        client = redis_service.get_redis_client()
-        redis_service.ensure_index(client)
-        client.close()
+        redis_service.init_redis()
         print("✅ Redis connected and index ready")
     except Exception as e:
         print(f"⚠️  Redis not available: {e}")
         print("   App will still run, but gravity features will be disabled")
+    # Shared async Redis pool for the request path; closed on shutdown
+    redis_service.get_async_redis()
+    # Optional on-device embedding model (ONNX_EMBEDDER_PATH)
+    await local_embedder.load()
     yield
+    await redis_service.close_async_redis()
 
 
 app = FastAPI(
@@ -73,11 +82,31 @@ async def health_check():
     }
 
 
+async def embed_generated_card(card: GeneratedCard):
+    """Save a freshly generated card for magnet lookups, then embed it and store it in Redis for gravity."""
+    await cards_store.put(card.model_dump())
+
+    try:
+        embedding = await embedding_service.batcher.submit(card.semantic_text)
+        card_vectors.add(card.id, embedding)
+        await redis_service.store_card_embedding(
+            card_id=card.id,
+            title=card.title,
+            category=card.category,
+            summary=card.summary,
+            embedding=embedding,
+        )
+    except Exception as e:
+        print(f"⚠️  Embedding/Redis storage failed for card {card.id}: {e}")
+        # Card still works without embedding — gravity just won't include it
+
+
 @app.post("/api/generate-card", response_model=GeneratedCard)
-async def generate_card(input_data: CardInput):
+async def generate_card(input_data: CardInput, background_tasks: BackgroundTasks):
     """
     Generate a card from raw user input using Claude.
     Claude determines the card type, title, widgets, and visual properties.
+    The card is returned as soon as Claude responds; embedding runs afterwards.
     """
     try:
         card = await claude_service.generate_card(
@@ -85,22 +114,8 @@ async def generate_card(input_data: CardInput):
             content_type=input_data.type,
         )
 
-        # Store in memory
-        cards_store[card.id] = card.model_dump()
-
-        # Auto-embed the card (non-blocking in production, but sync here for simplicity)
-        try:
-            embedding = await embedding_service.generate_embedding(card.semantic_text)
-            await redis_service.store_card_embedding(
-                card_id=card.id,
-                title=card.title,
-                category=card.category,
-                summary=card.summary,
-                embedding=embedding,
-            )
-        except Exception as e:
-            print(f"⚠️  Embedding/Redis storage failed for card {card.id}: {e}")
-            # Card still works without embedding — gravity just won't include it
+        # Save and auto-embed the card after the response is sent
+        background_tasks.add_task(embed_generated_card, card)
 
         return card
 
@@ -112,7 +127,8 @@ async def generate_card(input_data: CardInput):
 async def embed_card(request: EmbedRequest):
     """Generate and store an embedding for a card."""
     try:
-        embedding = await embedding_service.generate_embedding(request.text)
+        embedding = await embedding_service.batcher.submit(request.text)
+        card_vectors.add(request.card_id, embedding)
         await redis_service.store_card_embedding(
             card_id=request.card_id,
             title=request.text[:50],
@@ -125,14 +141,56 @@ async def embed_card(request: EmbedRequest):
         raise HTTPException(status_code=500, detail=f"Embedding failed: {str(e)}")
 
 
+async def embed_cards_bulk(cards: list[EmbedRequest]):
+    """Embed many cards through the Message Batches API and store them in Redis."""
+    try:
+        embeddings = await embedding_service.generate_embeddings_batch([c.text for c in cards])
+    except Exception as e:
+        print(f"⚠️  Bulk embedding failed for {len(cards)} cards: {e}")
+        return
+
+    embedded = [
+        {
+            "id": card.card_id,
+            "title": card.text[:50],
+            "category": "unknown",
+            "summary": card.text,
+            "embedding": embedding,
+        }
+        for card, embedding in zip(cards, embeddings)
+        if embedding is not None
+    ]
+    for card in embedded:
+        card_vectors.add(card["id"], card["embedding"])
+
+    try:
+        await redis_service.store_card_embeddings_bulk(embedded)
+    except Exception as e:
+        print(f"⚠️  Redis storage failed for {len(embedded)} cards: {e}")
+
+
+@app.post("/api/embed/bulk", response_model=BulkEmbedResponse)
+async def embed_cards(request: BulkEmbedRequest, background_tasks: BackgroundTasks):
+    """
+    Embed several cards at once (e.g. a trip import).
+    Returns immediately; a batch can take minutes, so embeddings land in the background.
+    """
+    if request.cards:
+        background_tasks.add_task(embed_cards_bulk, request.cards)
+    return BulkEmbedResponse(accepted=len(request.cards))
+
+
 @app.post("/api/gravity", response_model=GravityResponse)
 async def get_gravity(request: GravityRequest):
     """
     Get pairwise similarity scores between cards for gravity simulation.
     The frontend uses these scores to position cards — higher similarity = closer together.
+    Served from in-process vectors when every card is held locally, otherwise from Redis.
     """
     try:
-        pairs = await redis_service.get_similarity_pairs(request.card_ids)
+        pairs = card_vectors.similarity_pairs(request.card_ids)
+        if pairs is None:
+            pairs = await redis_service.get_similarity_pairs(request.card_ids)
         return GravityResponse(
             pairs=[
                 SimilarityPair(
@@ -156,15 +214,14 @@ async def apply_magnet(request: MagnetRequest):
     Uses Claude to score relevance — cards with high scores get pulled toward the magnet.
     """
     try:
-        # Get card data from memory
-        cards_data = []
-        for card_id in request.card_ids:
-            if card_id in cards_store:
-                cards_data.append(cards_store[card_id])
-            else:
-                cards_data.append({"id": card_id, "title": "Unknown", "summary": "", "category": "unknown"})
+        # Get card data from the LRU, falling back to Redis
+        cards = await cards_store.get_many(request.card_ids)
+        cards_data = [
+            card or {"id": card_id, "title": "Unknown", "summary": "", "category": "unknown"}
+            for card_id, card in zip(request.card_ids, cards)
+        ]
 
-        results = await claude_service.evaluate_magnet(request.constraint, cards_data)
+        results = await claude_service.evaluate_magnet(request.constraint, cards_data, batch=request.batch)
 
         return MagnetResponse(
             results=[
@@ -200,10 +257,22 @@ async def export_itinerary(request: ExportRequest):
         raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
 
+@app.post("/api/export/stream")
+async def export_itinerary_stream(request: ExportRequest):
+    """
+    Stream the Markdown itinerary as Claude writes it.
+    Same input as /api/export; the body is plain Markdown instead of ExportResponse JSON.
+    """
+    return StreamingResponse(
+        claude_service.stream_itinerary(request.cards),
+        media_type="text/markdown",
+    )
+
+
 @app.get("/api/cards")
 async def get_all_cards():
     """Get all cards currently in memory."""
-    return {"cards": list(cards_store.values())}
+    return {"cards": cards_store.values()}
 
 
 if __name__ == "__main__":
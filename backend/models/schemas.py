@@ -59,6 +59,14 @@ class EmbedResponse(BaseModel):
     success: bool
 
 
+class BulkEmbedRequest(BaseModel):
+    cards: list[EmbedRequest]
+
+
+class BulkEmbedResponse(BaseModel):
+    accepted: int
+
+
 class GravityRequest(BaseModel):
     card_ids: list[str]
 
@@ -76,6 +84,7 @@ class GravityResponse(BaseModel):
 class MagnetRequest(BaseModel):
     constraint: str
     card_ids: list[str]
+    batch: bool = False  # non-interactive re-scoring via the Message Batches API (half price, slower)
 
 
 class MagnetResult(BaseModel):
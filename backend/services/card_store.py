@@ -0,0 +1,179 @@
+"""
+Card Store — In-process card state backed by Redis.
+
+CardStore keeps card ids and int8-quantized embeddings as parallel arrays
+(struct-of-arrays), so pairwise similarity for a set of cards is a single
+matrix multiply instead of per-card Redis reads. It only holds cards
+embedded by this process, up to a bounded LRU size, and quantizes exactly
+like Redis so both gravity paths give the same scores.
+
+CardCache holds generated card data: a bounded LRU in front of one Redis
+hash per card, so memory stays flat and every worker can see every card.
+"""
+
+import orjson
+import numpy as np
+from collections import OrderedDict
+from cachetools import LRUCache
+from services import redis_service
+from services.embedding_service import EMBEDDING_DIM
+
+
+CARD_HASH_PREFIX = "cards:"
+CARD_CACHE_SIZE = 10_000
+CARD_VECTORS_SIZE = 10_000
+
+# Hash field listing which card fields are JSON-encoded (every non-str value)
+_JSON_FIELDS_KEY = "_json"
+# Hashes written before _JSON_FIELDS_KEY existed only JSON-encoded these
+_LEGACY_JSON_FIELDS = ("widgets",)
+
+
+class CardStore:
+    """Parallel `ids` / int8 codes / scales arrays with an LRU id → row index."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM, capacity: int = 64, maxsize: int = CARD_VECTORS_SIZE):
+        self.maxsize = maxsize
+        self.ids: list[str] = []
+        self._codes = np.zeros((min(capacity, maxsize), dim), dtype=np.int8)
+        self._scales = np.zeros(min(capacity, maxsize), dtype=np.float32)
+        # Least recently used first
+        self._rows: OrderedDict[str, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._rows
+
+    def add(self, card_id: str, embedding) -> None:
+        """
+        Store (or replace) a card's embedding, int8-quantized as in Redis.
+        Once full, the least recently used card's row is reused.
+        """
+        codes, scale = redis_service.quantize_int8(embedding)
+
+        row = self._rows.get(card_id)
+        if row is not None:
+            self._rows.move_to_end(card_id)
+        elif len(self.ids) < self.maxsize:
+            row = len(self.ids)
+            if row == len(self._codes):
+                # Double capacity (up to maxsize) so appends stay amortized O(1)
+                grow = min(len(self._codes), self.maxsize - len(self._codes))
+                self._codes = np.concatenate([self._codes, np.zeros((grow, self._codes.shape[1]), dtype=np.int8)])
+                self._scales = np.concatenate([self._scales, np.zeros(grow, dtype=np.float32)])
+            self.ids.append(card_id)
+            self._rows[card_id] = row
+        else:
+            _, row = self._rows.popitem(last=False)
+            self.ids[row] = card_id
+            self._rows[card_id] = row
+
+        self._codes[row] = codes
+        self._scales[row] = scale
+
+    def similarity_pairs(self, card_ids: list[str]) -> list[dict] | None:
+        """
+        Pairwise cosine similarity for the given cards, in the same
+        {card_a, card_b, similarity} shape as redis_service.get_similarity_pairs.
+        Returns None if any card isn't held locally, so the caller can fall back to Redis.
+        """
+        ids = list(dict.fromkeys(card_ids))
+        if any(card_id not in self._rows for card_id in ids):
+            return None
+        for card_id in ids:
+            self._rows.move_to_end(card_id)
+        if len(ids) < 2:
+            return []
+
+        rows = [self._rows[card_id] for card_id in ids]
+        return redis_service.similarity_pairs_from_codes(ids, self._codes[rows], self._scales[rows])
+
+
+class CardCache:
+    """Card dicts by id — LRU first, then HGETALL cards:{id}."""
+
+    def __init__(self, maxsize: int = CARD_CACHE_SIZE):
+        self._lru = LRUCache(maxsize=maxsize)
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def values(self) -> list[dict]:
+        """Cards currently held in this process."""
+        return list(self._lru.values())
+
+    async def put(self, card: dict) -> None:
+        """Cache a card locally and write it through to Redis."""
+        self._lru[card["id"]] = card
+        try:
+            await redis_service.get_async_redis().hset(
+                f"{CARD_HASH_PREFIX}{card['id']}", mapping=_encode_card(card)
+            )
+        except Exception as e:
+            print(f"⚠️ Card save failed for {card['id']}: {e}")
+
+    async def get(self, card_id: str) -> dict | None:
+        """Look a card up locally, falling back to Redis. None if unknown."""
+        card = self._lru.get(card_id)
+        if card is not None:
+            return card
+
+        try:
+            fields = await redis_service.get_async_redis().hgetall(f"{CARD_HASH_PREFIX}{card_id}")
+        except Exception as e:
+            print(f"⚠️ Card lookup failed for {card_id}: {e}")
+            return None
+        if not fields:
+            return None
+
+        card = _decode_card(fields)
+        self._lru[card_id] = card
+        return card
+
+    async def get_many(self, card_ids: list[str]) -> list[dict | None]:
+        """Look up several cards, in order. LRU misses cost one pipelined Redis round-trip."""
+        cards = [self._lru.get(card_id) for card_id in card_ids]
+        misses = [i for i, card in enumerate(cards) if card is None]
+        if not misses:
+            return cards
+
+        try:
+            async with redis_service.get_async_redis().pipeline(transaction=False) as pipe:
+                for i in misses:
+                    pipe.hgetall(f"{CARD_HASH_PREFIX}{card_ids[i]}")
+                results = await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Card lookup failed for {len(misses)} cards: {e}")
+            return cards
+
+        for i, fields in zip(misses, results):
+            if fields:
+                cards[i] = _decode_card(fields)
+                self._lru[card_ids[i]] = cards[i]
+        return cards
+
+
+def _encode_card(card: dict) -> dict:
+    """Strings are stored as-is; anything else (lists, numbers, None) as JSON, so it round-trips."""
+    json_fields = [field for field, value in card.items() if not isinstance(value, str)]
+    fields = {
+        field: orjson.dumps(value) if field in json_fields else value
+        for field, value in card.items()
+    }
+    fields[_JSON_FIELDS_KEY] = ",".join(json_fields)
+    return fields
+
+
+def _decode_card(fields: dict) -> dict:
+    fields = {field.decode(): value for field, value in fields.items()}
+    if _JSON_FIELDS_KEY in fields:
+        json_fields = set(fields.pop(_JSON_FIELDS_KEY).decode().split(","))
+    else:
+        json_fields = set(_LEGACY_JSON_FIELDS)
+
+    return {
+        field: orjson.loads(value) if field in json_fields else value.decode()
+        for field, value in fields.items()
+    }
@@ -5,14 +5,27 @@ Takes raw user input (text, URLs, notes) and asks Claude to generate
 a structured card schema with dynamic widgets.
 """
 
-import json
+import os
+import re
+import orjson
 import uuid
-import hashlib
+import asyncio
+import contextlib
+import xxhash
+import numpy as np
 import anthropic
-from models.schemas import GeneratedCard, Widget
-from services import redis_service
+from typing import AsyncIterator
+from pydantic import TypeAdapter
+from models.schemas import GeneratedCard, Widget, WidgetType
+from services import embedding_service, redis_service
 
 
+# Validates Claude's widget list in one pass
+_WidgetListAdapter = TypeAdapter(list[Widget])
+
+# Claude sometimes wraps JSON in a markdown code fence; capture what's inside
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
 CARD_SYSTEM_PROMPT = """You are a UI card generator for a spatial canvas app called Orbit, configured for Trip Planning.
 
 When a user drops content (text, URLs, notes) onto the canvas, you generate a structured JSON card with interactive widgets.
@@ -54,27 +67,147 @@ Respond ONLY with valid JSON matching this exact schema:
   "semantic_text": "string"
 }"""
 
+MAGNET_SYSTEM_PROMPT = """You evaluate how relevant cards are to a user's search constraint.
+Each card is given as {"id": card id, "t": title, "c": category}.
+Return a JSON array of objects with "id" and "relevance" (0.0 to 1.0).
+1.0 = perfectly matches the constraint, 0.0 = completely irrelevant.
+Respond ONLY with the JSON array, no other text."""
+
+SUGGEST_SYSTEM_PROMPT = """You are a travel planning assistant. The user has an incomplete itinerary represented by a list of items.
+Suggest EXACTLY 2 new, specific things to add to the itinerary to fill gaps (e.g. if they have a morning activity, suggest a lunch spot. If they have a hotel but no activities, suggest a popular activity nearby).
+Make the suggestions sound like practical search queries or natural language drops.
+Return a JSON array of 2 strings ONLY. Example: ["Lunch at a traditional trattoria nearby", "Afternoon visit to the local art museum"]"""
+
+EXPORT_SYSTEM_PROMPT = """You are a travel planning assistant. The user has arranged a set of travel items on a spatial canvas.
+Your job is to synthesize these items into a cohesive, beautifully formatted Markdown itinerary.
+Organize items logically by timeline (morning, afternoon, evening). If there are multiple days worth of items, try to group them logically.
+Use Markdown headers, bullet points, and basic styling.
+Do NOT output anything except the Markdown content itself. Do not write "Here is your itinerary"."""
+
+
+# System prompts as prompt-cacheable content blocks, built once at import
+_CARD_SYSTEM = [{"type": "text", "text": CARD_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+_MAGNET_SYSTEM = [{"type": "text", "text": MAGNET_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+_SUGGEST_SYSTEM = [{"type": "text", "text": SUGGEST_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+_EXPORT_SYSTEM = [{"type": "text", "text": EXPORT_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
+
+# Magnet prefilter: for larger canvases, cards whose embedding cosine to the
+# constraint is this clear-cut are scored without Claude
+MAGNET_PREFILTER_MIN_CARDS = 12
+MAGNET_ACCEPT_SIMILARITY = 0.85
+MAGNET_REJECT_SIMILARITY = 0.2
+
+# Magnet jobs queued for the Message Batches API flush once this many are
+# pending, or after the wait window so a lone job isn't stranded.
+MAGNET_BATCH_THRESHOLD = int(os.getenv("MAGNET_BATCH_THRESHOLD", "8"))
+MAGNET_BATCH_MAX_WAIT_SECONDS = float(os.getenv("MAGNET_BATCH_MAX_WAIT_SECONDS", "5"))
+MESSAGE_BATCH_POLL_SECONDS = 10
+
+_magnet_batch_queue: list[tuple[str, dict, asyncio.Future]] = []
+_magnet_batch_timer: asyncio.TimerHandle | None = None
+_batch_tasks: set[asyncio.Task] = set()
+
+# Claude card calls currently running, keyed by content hash (single-flight)
+_inflight_cards: dict[str, asyncio.Task] = {}
+
+_client: anthropic.AsyncAnthropic | None = None
+
+# Bound concurrent Claude calls so bursts queue here instead of tripping 429s
+CLAUDE_CONCURRENCY = int(os.getenv("CLAUDE_CONCURRENCY", "16"))
+CLAUDE_MAX_ATTEMPTS = 5
+_claude_semaphore = asyncio.Semaphore(CLAUDE_CONCURRENCY)
+
+
+def get_client() -> anthropic.AsyncAnthropic:
+    """
+    Get the shared Anthropic client, so every call reuses one HTTP connection pool.
+    Created on first use rather than at import, after main.py has loaded .env.
+    """
+    global _client
+    if _client is None:
+        # No SDK retries — create_message and _open_stream own the 429 retry policy
+        _client = anthropic.AsyncAnthropic(max_retries=0)
+    return _client
+
+
+async def create_message(**kwargs):
+    """
+    client.messages.create with at most CLAUDE_CONCURRENCY calls in flight.
+    Rate-limited calls are retried with exponential backoff, honoring Retry-After.
+    """
+    async with _claude_semaphore:
+        for attempt in range(CLAUDE_MAX_ATTEMPTS):
+            try:
+                return await get_client().messages.create(**kwargs)
+            except anthropic.RateLimitError as e:
+                await _rate_limit_backoff(e, attempt)
+
+
+async def _open_stream(stack: contextlib.AsyncExitStack, params: dict):
+    """
+    Enter client.messages.stream on the given exit stack, with create_message's
+    rate-limit retries — a 429 arrives when the stream opens, before any text.
+    The caller holds the semaphore for the life of the stream.
+    """
+    for attempt in range(CLAUDE_MAX_ATTEMPTS):
+        try:
+            return await stack.enter_async_context(get_client().messages.stream(**params))
+        except anthropic.RateLimitError as e:
+            await _rate_limit_backoff(e, attempt)
+
+
+async def _rate_limit_backoff(error: anthropic.RateLimitError, attempt: int) -> None:
+    """Sleep before retrying a rate-limited call; re-raise once the attempts are used up."""
+    if attempt == CLAUDE_MAX_ATTEMPTS - 1:
+        raise error
+    delay = _retry_after_seconds(error)
+    if delay is None:
+        delay = min(60, 2 ** attempt)
+    print(f"⏳ Claude rate limited, retrying in {delay:.0f}s (attempt {attempt + 1}/{CLAUDE_MAX_ATTEMPTS})")
+    await asyncio.sleep(delay)
+
+
+def _retry_after_seconds(error: anthropic.APIStatusError) -> float | None:
+    """The server's Retry-After hint in seconds, if it sent a usable one."""
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _log_prompt_cache(label: str, response) -> None:
+    """Log prompt-cache usage so cache hits on the system block are visible."""
+    usage = response.usage
+    print(
+        f"💾 Prompt cache [{label}]: read={usage.cache_read_input_tokens or 0} "
+        f"write={usage.cache_creation_input_tokens or 0} input={usage.input_tokens}"
+    )
+
 
 async def generate_card(content: str, content_type: str = "text") -> GeneratedCard:
     """
     Send user input to Claude, get back a structured card schema.
     Uses Redis to cache results for identical inputs to save API costs and improve speed.
     """
+    content_hash = xxhash.xxh3_128_hexdigest(f"{content_type}:{content}".encode())
+    cache_key = f"cache:card:{content_hash}"
+
     # 1. Check Redis cache first
     try:
-        content_hash = hashlib.md5(f"{content_type}:{content}".encode()).hexdigest()
-        cache_key = f"cache:card:{content_hash}"
-        redis_client = redis_service.get_redis_client()
-        cached_data = redis_client.get(cache_key)
+        cached_data = await redis_service.get_async_redis().get(cache_key)
         
         if cached_data:
             print(f"✨ CACHE HIT for card: {content[:30]}...")
-            card_data = json.loads(cached_data)
-            redis_client.close()
+            card_data = orjson.loads(cached_data)
             
-            # Reconstruct the GeneratedCard object from cache
-            widgets = [Widget(**w) for w in card_data.get("widgets", [])]
-            return GeneratedCard(
+            # Reconstruct the GeneratedCard object from cache — this data was validated
+            # before it was cached, so skip re-validation
+            widgets = [
+                Widget.model_construct(**{**w, "type": WidgetType(w["type"])})
+                for w in card_data.get("widgets", [])
+            ]
+            return GeneratedCard.model_construct(
                 id=str(uuid.uuid4())[:8],  # Generate new ID so duplicates can exist on canvas
                 title=card_data["title"],
                 summary=card_data["summary"],
@@ -86,50 +219,51 @@ async def generate_card(content: str, content_type: str = "text") -> GeneratedCa
                 raw_input=content,
                 semantic_text=card_data["semantic_text"],
             )
-        redis_client.close()
     except Exception as e:
         print(f"⚠️ Cache check failed: {e}")
 
-    # 2. Not in cache, call Claude
-    print(f"🧠 CALLING CLAUDE for card: {content[:30]}...")
-    client = anthropic.AsyncAnthropic()
+    # 2. Not in cache — identical concurrent drops share a single Claude call
+    task = _inflight_cards.get(content_hash)
+    if task is None:
+        task = asyncio.create_task(_create_card(content, content_type, cache_key))
+        _inflight_cards[content_hash] = task
+        task.add_done_callback(lambda _: _inflight_cards.pop(content_hash, None))
+        return await asyncio.shield(task)
 
+    print(f"🔗 JOINING in-flight Claude call for card: {content[:30]}...")
+    card = await asyncio.shield(task)
+    # New ID so duplicates can exist on canvas
+    return card.model_copy(update={"id": str(uuid.uuid4())[:8]})
+
+
+async def _create_card(content: str, content_type: str, cache_key: str) -> GeneratedCard:
+    """Call Claude for a new card and cache the result."""
+    print(f"🧠 CALLING CLAUDE for card: {content[:30]}...")
     user_message = f"Content type: {content_type}\nContent: {content}"
 
-    response = await client.messages.create(
+    response = await create_message(
         model="claude-sonnet-4-20250514",
         max_tokens=1024,
-        system=CARD_SYSTEM_PROMPT,
+        system=_CARD_SYSTEM,
         messages=[
             {"role": "user", "content": user_message}
         ]
     )
+    _log_prompt_cache("card", response)
 
     # Parse Claude's JSON response
     response_text = response.content[0].text
 
     # Handle potential markdown code blocks in response
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0]
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0]
+    m = _FENCE_RE.search(response_text)
+    response_text = m.group(1) if m else response_text
 
-    card_data = json.loads(response_text.strip())
+    card_data = orjson.loads(response_text.strip())
 
     # Build the card
     card_id = str(uuid.uuid4())[:8]
 
-    widgets = []
-    for w in card_data.get("widgets", []):
-        widgets.append(Widget(
-            type=w["type"],
-            label=w["label"],
-            value=w.get("value"),
-            min=w.get("min"),
-            max=w.get("max"),
-            color=w.get("color"),
-            icon=w.get("icon"),
-        ))
+    widgets = _WidgetListAdapter.validate_python(card_data.get("widgets", []))
 
     card = GeneratedCard(
         id=card_id,
@@ -144,9 +278,8 @@ async def generate_card(content: str, content_type: str = "text") -> GeneratedCa
         semantic_text=card_data["semantic_text"],
     )
 
-    # 3. Save to Redis cache for future requests (expire after 7 days)
+    # Save to Redis cache for future requests (expire after 7 days)
     try:
-        redis_client = redis_service.get_redis_client()
         # Cache the parsed data (without the ID, so new IDs get generated on cache hit)
         cache_value = {
             "title": card.title,
@@ -158,19 +291,22 @@ async def generate_card(content: str, content_type: str = "text") -> GeneratedCa
             "widgets": [w.model_dump() for w in card.widgets],
             "semantic_text": card.semantic_text,
         }
-        redis_client.setex(cache_key, 604800, json.dumps(cache_value))
-        redis_client.close()
+        await redis_service.get_async_redis().setex(cache_key, 604800, orjson.dumps(cache_value))
     except Exception as e:
         print(f"⚠️ Cache save failed: {e}")
 
     return card
 
 
-async def evaluate_magnet(constraint: str, cards: list[dict]) -> list[dict]:
+async def evaluate_magnet(constraint: str, cards: list[dict], batch: bool = False) -> list[dict]:
     """
     Use Claude to evaluate how relevant each card is to a magnet constraint.
     Returns relevance scores 0.0-1.0 for each card.
     Uses Redis caching to avoid re-evaluating the same cards for the same constraint.
+    On larger canvases, cards whose embedding clearly matches or misses the constraint
+    are scored locally and only the ambiguous ones are sent to Claude.
+    With batch=True the request is queued for the Message Batches API instead
+    (half price, but results can take minutes) — only for non-interactive re-scoring.
     """
     if not cards:
         return []
@@ -180,60 +316,182 @@ async def evaluate_magnet(constraint: str, cards: list[dict]) -> list[dict]:
         # Create a deterministic hash based on constraint + sorted card IDs
         card_ids = sorted([str(c.get("id", "")) for c in cards])
         ids_string = ",".join(card_ids)
-        content_hash = hashlib.md5(f"{constraint}:{ids_string}".encode()).hexdigest()
+        content_hash = xxhash.xxh3_128_hexdigest(f"{constraint}:{ids_string}".encode())
         cache_key = f"cache:magnet:{content_hash}"
         
-        redis_client = redis_service.get_redis_client()
-        cached_data = redis_client.get(cache_key)
+        cached_data = await redis_service.get_async_redis().get(cache_key)
         
         if cached_data:
             print(f"🧲 CACHE HIT for magnet: '{constraint}' with {len(cards)} cards")
-            results = json.loads(cached_data)
-            redis_client.close()
-            return results
-            
-        redis_client.close()
+            return orjson.loads(cached_data)
     except Exception as e:
         print(f"⚠️ Magnet cache check failed: {e}")
 
-    # 2. Not in cache, call Claude
-    print(f"🧠 CALLING CLAUDE for magnet: '{constraint}'...")
-    client = anthropic.AsyncAnthropic()
+    # 2. Settle clear-cut cards by embedding similarity; only the rest go to Claude
+    results = []
+    ambiguous = cards
+    if len(cards) >= MAGNET_PREFILTER_MIN_CARDS:
+        results, ambiguous = await _prefilter_magnet(constraint, cards)
+
+    if ambiguous:
+        results += await _score_magnet_with_claude(constraint, ambiguous, batch)
+
+    # 3. Save to Redis cache for future requests (expire after 1 hour)
+    try:
+        await redis_service.get_async_redis().setex(cache_key, 3600, orjson.dumps(results))
+    except Exception as e:
+        print(f"⚠️ Magnet cache save failed: {e}")
+
+    return results
 
-    cards_summary = json.dumps([
-        {"id": c["id"], "title": c["title"], "summary": c["summary"], "category": c["category"]}
+
+async def _prefilter_magnet(constraint: str, cards: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    Score cards whose embedding is clearly close to (or far from) the constraint's
+    without asking Claude. Returns (settled results, cards that still need Claude).
+    Cards without a stored embedding count as ambiguous.
+    """
+    try:
+        # Constraints are usually a word or two — skip the keyword-only short-text path
+        query = np.asarray(await embedding_service.generate_embedding(constraint, allow_short=False), dtype=np.float32)
+        embeddings = await redis_service.get_card_embeddings([c["id"] for c in cards])
+    except Exception as e:
+        print(f"⚠️ Magnet prefilter skipped: {e}")
+        return [], cards
+
+    ids = [c["id"] for c in cards if c["id"] in embeddings]
+    if not ids:
+        return [], cards
+
+    vecs = np.stack([embeddings[card_id] for card_id in ids])
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True).clip(1e-12)
+    sims = dict(zip(ids, (vecs @ (query / max(np.linalg.norm(query), 1e-12))).tolist()))
+
+    settled, ambiguous = [], []
+    for c in cards:
+        sim = sims.get(c["id"])
+        if sim is not None and sim >= MAGNET_ACCEPT_SIMILARITY:
+            settled.append({"id": c["id"], "relevance": 1.0})
+        elif sim is not None and sim <= MAGNET_REJECT_SIMILARITY:
+            settled.append({"id": c["id"], "relevance": 0.0})
+        else:
+            ambiguous.append(c)
+
+    print(f"🧲 Prefilter settled {len(settled)}/{len(cards)} cards for magnet: '{constraint}'")
+    return settled, ambiguous
+
+
+async def _score_magnet_with_claude(constraint: str, cards: list[dict], batch: bool) -> list[dict]:
+    """Ask Claude for a relevance score per card."""
+    # Title + category is enough to score relevance; short keys keep input tokens down
+    cards_summary = orjson.dumps([
+        {"id": c["id"], "t": c["title"], "c": c["category"]}
         for c in cards
-    ], indent=2)
+    ]).decode()
 
-    response = await client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=512,
-        system="""You evaluate how relevant cards are to a user's search constraint.
-Return a JSON array of objects with "id" and "relevance" (0.0 to 1.0).
-1.0 = perfectly matches the constraint, 0.0 = completely irrelevant.
-Respond ONLY with the JSON array, no other text.""",
-        messages=[
+    params = {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 512,
+        "system": _MAGNET_SYSTEM,
+        "messages": [
             {"role": "user", "content": f"Constraint: {constraint}\n\nCards:\n{cards_summary}"}
-        ]
-    )
+        ],
+    }
 
-    response_text = response.content[0].text
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0]
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0]
+    if batch:
+        print(f"📦 QUEUEING CLAUDE BATCH for magnet: '{constraint}'...")
+        response_text = await _submit_magnet_batch_job(params)
+    else:
+        print(f"🧠 CALLING CLAUDE for magnet: '{constraint}'...")
+        response = await create_message(**params)
+        _log_prompt_cache("magnet", response)
+        response_text = response.content[0].text
 
-    results = json.loads(response_text.strip())
+    m = _FENCE_RE.search(response_text)
+    response_text = m.group(1) if m else response_text
 
-    # 3. Save to Redis cache for future requests (expire after 1 hour)
+    return orjson.loads(response_text.strip())
+
+
+async def run_message_batch(requests: list[dict]) -> dict[str, str]:
+    """
+    Submit requests ({"custom_id", "params"}) through the Message Batches API and
+    wait for the batch to finish. Returns the response text keyed by custom_id;
+    requests that errored or expired are left out.
+    """
+    client = get_client()
+    message_batch = await client.messages.batches.create(requests=requests)
+
+    while message_batch.processing_status != "ended":
+        await asyncio.sleep(MESSAGE_BATCH_POLL_SECONDS)
+        message_batch = await client.messages.batches.retrieve(message_batch.id)
+
+    texts = {}
+    async for entry in await client.messages.batches.results(message_batch.id):
+        if entry.result.type == "succeeded":
+            texts[entry.custom_id] = entry.result.message.content[0].text
+        else:
+            print(f"⚠️ Batch request {entry.custom_id} {entry.result.type}")
+    return texts
+
+
+async def _submit_magnet_batch_job(params: dict) -> str:
+    """Queue one magnet evaluation for the next batch and wait for its response text."""
+    global _magnet_batch_timer
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _magnet_batch_queue.append((uuid.uuid4().hex, params, future))
+
+    if len(_magnet_batch_queue) >= MAGNET_BATCH_THRESHOLD:
+        _flush_magnet_batch()
+    elif _magnet_batch_timer is None:
+        # Don't strand a partial queue — send whatever is pending after the wait window
+        _magnet_batch_timer = loop.call_later(MAGNET_BATCH_MAX_WAIT_SECONDS, _flush_magnet_batch)
+
+    return await future
+
+
+def _flush_magnet_batch() -> None:
+    """Hand every queued magnet job to a background batch run."""
+    global _magnet_batch_timer
+
+    if _magnet_batch_timer is not None:
+        _magnet_batch_timer.cancel()
+        _magnet_batch_timer = None
+
+    jobs = _magnet_batch_queue[:]
+    _magnet_batch_queue.clear()
+    if not jobs:
+        return
+
+    task = asyncio.create_task(_run_magnet_batch(jobs))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
+
+async def _run_magnet_batch(jobs: list[tuple[str, dict, asyncio.Future]]) -> None:
+    """Run one batch and fan each result back to the coroutine awaiting it."""
+    print(f"📦 SUBMITTING CLAUDE BATCH with {len(jobs)} magnet evaluations")
     try:
-        redis_client = redis_service.get_redis_client()
-        redis_client.setex(cache_key, 3600, json.dumps(results))
-        redis_client.close()
+        texts = await run_message_batch([
+            {"custom_id": custom_id, "params": params}
+            for custom_id, params, _ in jobs
+        ])
     except Exception as e:
-        print(f"⚠️ Magnet cache save failed: {e}")
+        for _, _, future in jobs:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for custom_id, _, future in jobs:
+        if future.done():
+            continue
+        if custom_id in texts:
+            future.set_result(texts[custom_id])
+        else:
+            future.set_exception(RuntimeError(f"Batch request {custom_id} did not succeed"))
 
-    return results
 
 async def suggest_next(cards: list[dict]) -> list[str]:
     """
@@ -243,50 +501,55 @@ async def suggest_next(cards: list[dict]) -> list[str]:
     if not cards:
         return ["A historic hotel in the city center", "A highly-rated local restaurant"]
 
-    print("🧠 CALLING CLAUDE for suggestions...")
-    client = anthropic.AsyncAnthropic()
+    # 1. Check Redis cache first — repeat polls of an unchanged canvas skip Claude
+    cache_key = f"cache:suggest:{_canvas_fingerprint(cards)}"
+    try:
+        cached_data = await redis_service.get_async_redis().get(cache_key)
+        if cached_data:
+            print(f"💡 CACHE HIT for suggestions with {len(cards)} cards")
+            return orjson.loads(cached_data)
+    except Exception as e:
+        print(f"⚠️ Suggest cache check failed: {e}")
 
-    cards_summary = json.dumps([
+    # 2. Not in cache, call Claude
+    print("🧠 CALLING CLAUDE for suggestions...")
+    cards_summary = orjson.dumps([
         {"title": c["title"], "summary": c["summary"], "category": c["category"]}
         for c in cards
-    ], indent=2)
+    ]).decode()
 
-    response = await client.messages.create(
+    response = await create_message(
         model="claude-sonnet-4-20250514",
         max_tokens=256,
-        system="""You are a travel planning assistant. The user has an incomplete itinerary represented by a list of items.
-Suggest EXACTLY 2 new, specific things to add to the itinerary to fill gaps (e.g. if they have a morning activity, suggest a lunch spot. If they have a hotel but no activities, suggest a popular activity nearby).
-Make the suggestions sound like practical search queries or natural language drops.
-Return a JSON array of 2 strings ONLY. Example: ["Lunch at a traditional trattoria nearby", "Afternoon visit to the local art museum"]""",
+        system=_SUGGEST_SYSTEM,
         messages=[
             {"role": "user", "content": f"Current Itinerary:\n{cards_summary}"}
         ]
     )
+    _log_prompt_cache("suggest", response)
 
     response_text = response.content[0].text
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0]
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0]
+    m = _FENCE_RE.search(response_text)
+    response_text = m.group(1) if m else response_text
 
     try:
-        suggestions = json.loads(response_text.strip())
-        return suggestions[:2]
+        suggestions = orjson.loads(response_text.strip())[:2]
     except Exception as e:
         print(f"Failed to parse suggestions: {e}")
         return ["A local coffee shop", "A scenic walking tour"]
 
-async def export_itinerary(cards: list[dict]) -> str:
-    """
-    Take all cards on the canvas and format them into a clean, chronological Markdown itinerary.
-    """
-    if not cards:
-        return "No items in itinerary yet."
+    # 3. Save to Redis cache (expire after 5 minutes)
+    try:
+        await redis_service.get_async_redis().setex(cache_key, 300, orjson.dumps(suggestions))
+    except Exception as e:
+        print(f"⚠️ Suggest cache save failed: {e}")
+
+    return suggestions
 
-    print("🧠 CALLING CLAUDE for itinerary export...")
-    client = anthropic.AsyncAnthropic()
 
-    cards_summary = json.dumps([
+def _export_params(cards: list[dict]) -> dict:
+    """Claude request for turning canvas cards into a Markdown itinerary."""
+    cards_summary = orjson.dumps([
         {
             "title": c["title"], 
             "summary": c["summary"], 
@@ -294,19 +557,90 @@ async def export_itinerary(cards: list[dict]) -> str:
             "time_of_day": c.get("time_of_day", "anytime")
         }
         for c in cards
-    ], indent=2)
+    ]).decode()
 
-    response = await client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=2048,
-        system="""You are a travel planning assistant. The user has arranged a set of travel items on a spatial canvas.
-Your job is to synthesize these items into a cohesive, beautifully formatted Markdown itinerary.
-Organize items logically by timeline (morning, afternoon, evening). If there are multiple days worth of items, try to group them logically.
-Use Markdown headers, bullet points, and basic styling.
-Do NOT output anything except the Markdown content itself. Do not write "Here is your itinerary".""",
-        messages=[
+    return {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 2048,
+        "system": _EXPORT_SYSTEM,
+        "messages": [
             {"role": "user", "content": f"Canvas Cards:\n{cards_summary}"}
-        ]
-    )
+        ],
+    }
+
+
+async def export_itinerary(cards: list[dict]) -> str:
+    """
+    Take all cards on the canvas and format them into a clean, chronological Markdown itinerary.
+    """
+    if not cards:
+        return "No items in itinerary yet."
+
+    # 1. Check Redis cache first
+    cache_key = f"cache:export:{_canvas_fingerprint(cards)}"
+    cached_data = await _get_cached_export(cache_key)
+    if cached_data:
+        return cached_data
 
-    return response.content[0].text.strip()
+    # 2. Not in cache, call Claude
+    print("🧠 CALLING CLAUDE for itinerary export...")
+    response = await create_message(**_export_params(cards))
+    _log_prompt_cache("export", response)
+    markdown = response.content[0].text.strip()
+
+    await _save_cached_export(cache_key, markdown)
+    return markdown
+
+
+async def stream_itinerary(cards: list[dict]) -> AsyncIterator[str]:
+    """
+    Streaming variant of export_itinerary — yields Markdown text as Claude writes it,
+    so the first words arrive after one token instead of the whole itinerary.
+    """
+    if not cards:
+        yield "No items in itinerary yet."
+        return
+
+    # A cached export is sent as a single chunk
+    cache_key = f"cache:export:{_canvas_fingerprint(cards)}"
+    cached_data = await _get_cached_export(cache_key)
+    if cached_data:
+        yield cached_data
+        return
+
+    print("🧠 STREAMING CLAUDE itinerary export...")
+    async with _claude_semaphore, contextlib.AsyncExitStack() as stack:
+        stream = await _open_stream(stack, _export_params(cards))
+        async for text in stream.text_stream:
+            yield text
+        message = await stream.get_final_message()
+    _log_prompt_cache("export", message)
+
+    await _save_cached_export(cache_key, message.content[0].text.strip())
+
+
+def _canvas_fingerprint(cards: list[dict]) -> str:
+    """Order-independent hash of the card fields the suggest/export prompts use."""
+    return xxhash.xxh3_128_hexdigest(orjson.dumps(sorted(
+        (c["title"], c["summary"], c["category"], c.get("time_of_day", "anytime"))
+        for c in cards
+    )))
+
+
+async def _get_cached_export(cache_key: str) -> str | None:
+    try:
+        cached_data = await redis_service.get_async_redis().get(cache_key)
+        if cached_data:
+            print("📄 CACHE HIT for itinerary export")
+            return cached_data.decode()
+    except Exception as e:
+        print(f"⚠️ Export cache check failed: {e}")
+    return None
+
+
+async def _save_cached_export(cache_key: str, markdown: str) -> None:
+    """Save an export to Redis cache (expire after 10 minutes)."""
+    try:
+        await redis_service.get_async_redis().setex(cache_key, 600, markdown)
+    except Exception as e:
+        print(f"⚠️ Export cache save failed: {e}")
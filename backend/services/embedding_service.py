@@ -6,17 +6,85 @@ then we hash those features into a fixed-dimension vector.
 This avoids needing a separate embedding model while still capturing meaning.
 """
 
-import hashlib
-import json
+import re
+import orjson
+import asyncio
+import xxhash
 import numpy as np
-import anthropic
-from services import redis_service
+from services import claude_service, local_embedder, redis_service
 
 
 EMBEDDING_DIM = 256
 
+# Values are raw float32 bytes. Bump the version whenever _features_to_vector or the
+# value format changes, so stale vectors aren't mixed with new ones
+EMBEDDING_CACHE_PREFIX = "cache:embedding:v4:"
 
-async def generate_embedding(text: str) -> list[float]:
+# Claude sometimes wraps JSON in a markdown code fence; capture what's inside
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
+FEATURE_SCHEMA = """{
+  "category": "one word category (hotel, flight, restaurant, activity, transit, note, other)",
+  "location_keywords": ["list", "of", "location", "words", "like", "neighborhood", "city"],
+  "vibe_keywords": ["list", "of", "descriptive", "vibes", "like", "historic", "modern", "nature", "urban"],
+  "price_level": 0-5 (0=not applicable, 1=budget, 5=luxury),
+  "quality_signal": 0-5 (0=not applicable, 1=poor, 5=excellent),
+  "mood": "one word mood (relaxing, adventurous, romantic, family, cultural, party, business, casual)",
+  "time_of_day": "one word time (morning, afternoon, evening, night, anytime)"
+}"""
+
+FEATURE_SYSTEM_PROMPT = f"""Extract semantic features from the travel/trip-planning text. Return a JSON object with these exact fields:
+{FEATURE_SCHEMA}
+Respond ONLY with the JSON object."""
+
+FEATURE_BATCH_SYSTEM_PROMPT = f"""Extract semantic features from each travel/trip-planning text in the JSON array you are given.
+Return a JSON array with exactly one object per text, in the same order, each with these exact fields:
+{FEATURE_SCHEMA}
+Respond ONLY with the JSON array."""
+
+# Feature prompts as prompt-cacheable content blocks, built once at import
+_FEATURE_SYSTEM = [{"type": "text", "text": FEATURE_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+_FEATURE_BATCH_SYSTEM = [{"type": "text", "text": FEATURE_BATCH_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
+# Vocabularies for the categorical features; the last entry is the fallback
+_CATEGORIES = ["hotel", "flight", "restaurant", "activity", "transit", "note", "other", "unknown"]
+_MOODS = ["relaxing", "adventurous", "romantic", "family", "cultural", "party", "business", "casual"]
+_TIMES = ["morning", "afternoon", "evening", "night", "anytime", "unknown"]
+
+# Hash embeddings: every feature token is the sum of two rows of a fixed,
+# seeded pool of dense component vectors, so all 256 dims carry every feature
+EMBEDDING_COMPONENTS = 4096
+_COMPONENTS = np.random.default_rng(0).standard_normal((EMBEDDING_COMPONENTS, EMBEDDING_DIM)).astype(np.float32)
+
+# Per-token weights — the categorical ones match the norm of the old one-hot spreads
+CATEGORY_WEIGHT = 2.0
+MOOD_WEIGHT = 3 ** 0.5
+TIME_WEIGHT = 5 ** 0.5
+KEYWORD_WEIGHT = 1.0
+WORD_WEIGHT = 0.3
+
+# Texts with fewer words than this skip Claude; common words that imply a category or time
+SHORT_TEXT_MAX_WORDS = 3
+_SHORT_TEXT_CATEGORIES = {
+    "hostel": "hotel", "airbnb": "hotel", "resort": "hotel", "stay": "hotel",
+    "airport": "flight", "plane": "flight",
+    "breakfast": "restaurant", "brunch": "restaurant", "lunch": "restaurant",
+    "dinner": "restaurant", "cafe": "restaurant", "coffee": "restaurant", "bar": "restaurant",
+    "train": "transit", "bus": "transit", "taxi": "transit", "metro": "transit", "ferry": "transit",
+    "tour": "activity", "museum": "activity", "hike": "activity", "beach": "activity", "park": "activity",
+    "todo": "note", "reminder": "note",
+}
+_SHORT_TEXT_TIMES = {
+    "breakfast": "morning", "brunch": "morning", "lunch": "afternoon",
+    "dinner": "evening", "tonight": "night",
+}
+
+# Embedding requests arriving within this window are coalesced into one Claude call
+EMBEDDING_BATCH_MAX_SIZE = 16
+EMBEDDING_BATCH_MAX_WAIT_MS = 25
+
+
+async def generate_embedding(text: str, allow_short: bool = True) -> np.ndarray:
     """
     Generate a semantic embedding vector for the given text.
 
@@ -24,122 +92,384 @@ async def generate_embedding(text: str) -> list[float]:
     then convert those features into a stable numeric vector.
     This gives us meaningful similarity without a dedicated embedding model.
     Uses Redis caching to avoid Claude API calls for previously seen text.
+    If a local ONNX model is configured, it is used instead of Claude.
+
+    Pass allow_short=False to always extract features with Claude — short
+    queries like a magnet constraint ("romantic") need the keywords.
     """
+    if local_embedder.available():
+        return (await local_embedder.embed([text]))[0]
+
+    # Short texts carry too little for Claude to add anything — classify them locally
+    vector = _short_text_vector(text) if allow_short else None
+    if vector is not None:
+        return vector
+
     # 1. Check Redis cache first
     try:
-        content_hash = hashlib.md5(text.encode()).hexdigest()
-        cache_key = f"cache:embedding:{content_hash}"
-        redis_client = redis_service.get_redis_client()
-        cached_data = redis_client.get(cache_key)
-        
+        cache_key = _cache_key(text)
+        cached_data = await redis_service.get_async_redis().get(cache_key)
+
         if cached_data:
             # We don't print here to avoid spamming logs on lots of identical embeddings
-            vector = json.loads(cached_data)
-            redis_client.close()
+            vector = np.frombuffer(cached_data, dtype=np.float32)
             return vector
-            
-        redis_client.close()
+
     except Exception as e:
         print(f"⚠️ Embedding cache check failed: {e}")
 
     # 2. Not in cache, call Claude
-    client = anthropic.AsyncAnthropic()
-
-    response = await client.messages.create(
+    response = await claude_service.create_message(
         model="claude-sonnet-4-20250514",
         max_tokens=512,
-        system="""Extract semantic features from the travel/trip-planning text. Return a JSON object with these exact fields:
-{
-  "category": "one word category (hotel, flight, restaurant, activity, transit, note, other)",
-  "location_keywords": ["list", "of", "location", "words", "like", "neighborhood", "city"],
-  "vibe_keywords": ["list", "of", "descriptive", "vibes", "like", "historic", "modern", "nature", "urban"],
-  "price_level": 0-5 (0=not applicable, 1=budget, 5=luxury),
-  "quality_signal": 0-5 (0=not applicable, 1=poor, 5=excellent),
-  "mood": "one word mood (relaxing, adventurous, romantic, family, cultural, party, business, casual)",
-  "time_of_day": "one word time (morning, afternoon, evening, night, anytime)"
-}
-Respond ONLY with the JSON object.""",
+        system=_FEATURE_SYSTEM,
         messages=[{"role": "user", "content": text}]
     )
 
     response_text = response.content[0].text
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0]
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0]
+    m = _FENCE_RE.search(response_text)
+    response_text = m.group(1) if m else response_text
 
-    features = json.loads(response_text.strip())
+    features = orjson.loads(response_text.strip())
 
     # Convert features to a stable embedding vector
     vector = _features_to_vector(features, text)
 
     # 3. Save to Redis cache for future requests (expire after 30 days)
     try:
-        redis_client = redis_service.get_redis_client()
-        redis_client.setex(cache_key, 2592000, json.dumps(vector))
-        redis_client.close()
+        await redis_service.get_async_redis().setex(cache_key, 2592000, vector.tobytes())
     except Exception as e:
         print(f"⚠️ Embedding cache save failed: {e}")
 
     return vector
 
 
-def _features_to_vector(features: dict, raw_text: str) -> list[float]:
+async def generate_embeddings(texts: list[str]) -> list[np.ndarray | None]:
+    """
+    Batched variant of generate_embedding — one vector per text, in order.
+
+    Short texts are classified locally and cached texts are served from Redis;
+    every other miss goes to Claude in a single call that extracts features
+    for the whole list. If that reply can't be matched up with the texts, each
+    miss falls back to its own generate_embedding call; texts whose fallback
+    failed come back as None.
+    """
+    if local_embedder.available():
+        return await local_embedder.embed(texts)
+
+    cache_keys = [_cache_key(t) for t in texts]
+    vectors: list[np.ndarray | None] = [_short_text_vector(t) for t in texts]
+    pending = [i for i, v in enumerate(vectors) if v is None]
+    if not pending:
+        return vectors
+
+    # 1. Check Redis cache first (one round-trip for the whole batch)
+    try:
+        cached = await redis_service.get_async_redis().mget([cache_keys[i] for i in pending])
+        for i, cached_data in zip(pending, cached):
+            if cached_data:
+                vectors[i] = np.frombuffer(cached_data, dtype=np.float32)
+    except Exception as e:
+        print(f"⚠️ Embedding cache check failed: {e}")
+
+    misses = [i for i, v in enumerate(vectors) if v is None]
+    if not misses:
+        return vectors
+
+    # 2. Extract features for every miss in one Claude call
+    response = await claude_service.create_message(
+        model="claude-sonnet-4-20250514",
+        max_tokens=512 * len(misses),
+        system=_FEATURE_BATCH_SYSTEM,
+        messages=[{"role": "user", "content": orjson.dumps([texts[i] for i in misses]).decode()}]
+    )
+
+    response_text = response.content[0].text
+    m = _FENCE_RE.search(response_text)
+    response_text = m.group(1) if m else response_text
+
+    try:
+        features_list = orjson.loads(response_text.strip())
+        if not isinstance(features_list, list) or len(features_list) != len(misses):
+            raise ValueError(f"expected {len(misses)} feature objects")
+        for i, features in zip(misses, features_list):
+            vectors[i] = _features_to_vector(features, texts[i])
+    except Exception as e:
+        # One bad reply shouldn't fail every card in the batch — embed the misses one by one
+        print(f"⚠️ Batched features unusable ({e}), embedding {len(misses)} texts individually")
+        return await _embed_individually(texts, vectors, misses)
+
+    # 3. Save to Redis cache for future requests (expire after 30 days)
+    try:
+        async with redis_service.get_async_redis().pipeline(transaction=False) as pipe:
+            for i in misses:
+                pipe.setex(cache_keys[i], 2592000, vectors[i].tobytes())
+            await pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Embedding cache save failed: {e}")
+
+    return vectors
+
+
+async def _embed_individually(texts: list[str], vectors: list, misses: list[int]) -> list[np.ndarray | None]:
+    """Fill vectors[i] for each miss with its own generate_embedding call (None if it fails)."""
+    results = await asyncio.gather(*(generate_embedding(texts[i]) for i in misses), return_exceptions=True)
+    for i, result in zip(misses, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Embedding failed for text {i}: {result}")
+            result = None
+        vectors[i] = result
+    return vectors
+
+
+async def generate_embeddings_batch(texts: list[str]) -> list[np.ndarray | None]:
+    """
+    Bulk-ingest variant of generate_embeddings — one vector per text, in order.
+
+    Misses go through the Message Batches API (one request per distinct text,
+    custom_id = its content hash) at half the price of synchronous calls, so
+    this can take minutes; only use it off the request path. Texts whose batch
+    request failed come back as None.
+    """
+    if local_embedder.available():
+        return await local_embedder.embed(texts)
+
+    hashes = [_content_hash(t) for t in texts]
+    cache_keys = [f"{EMBEDDING_CACHE_PREFIX}{h}" for h in hashes]
+    vectors: list[np.ndarray | None] = [_short_text_vector(t) for t in texts]
+    pending = [i for i, v in enumerate(vectors) if v is None]
+    if not pending:
+        return vectors
+    redis_client = redis_service.get_async_redis()
+
+    # 1. Check Redis cache first (one round-trip for the whole batch)
+    try:
+        cached = await redis_client.mget([cache_keys[i] for i in pending])
+        for i, cached_data in zip(pending, cached):
+            if cached_data:
+                vectors[i] = np.frombuffer(cached_data, dtype=np.float32)
+    except Exception as e:
+        print(f"⚠️ Embedding cache check failed: {e}")
+
+    # Texts that normalize the same share one batch request
+    misses = {hashes[i]: texts[i] for i, v in enumerate(vectors) if v is None}
+    if not misses:
+        return vectors
+
+    # 2. Extract features for every miss in one message batch
+    responses = await claude_service.run_message_batch([
+        {
+            "custom_id": content_hash,
+            "params": {
+                "model": "claude-sonnet-4-20250514",
+                "max_tokens": 512,
+                "system": _FEATURE_SYSTEM,
+                "messages": [{"role": "user", "content": text}],
+            },
+        }
+        for content_hash, text in misses.items()
+    ])
+
+    computed = {}
+    for content_hash, response_text in responses.items():
+        m = _FENCE_RE.search(response_text)
+        response_text = m.group(1) if m else response_text
+        try:
+            features = orjson.loads(response_text.strip())
+        except orjson.JSONDecodeError as e:
+            print(f"⚠️ Unparseable features for {content_hash}: {e}")
+            continue
+        computed[content_hash] = _features_to_vector(features, misses[content_hash])
+
+    for i, content_hash in enumerate(hashes):
+        if vectors[i] is None:
+            vectors[i] = computed.get(content_hash)
+
+    # 3. Save to Redis cache for future requests (expire after 30 days)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for content_hash, vector in computed.items():
+                pipe.setex(f"{EMBEDDING_CACHE_PREFIX}{content_hash}", 2592000, vector.tobytes())
+            await pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Embedding cache save failed: {e}")
+
+    return vectors
+
+
+def _short_text_vector(text: str) -> np.ndarray | None:
+    """
+    Embed texts under SHORT_TEXT_MAX_WORDS words ("Lunch", "Hotel Arts") without
+    Claude: categorical features come from a keyword match. None for longer texts.
+    """
+    words = text.lower().split()
+    if len(words) >= SHORT_TEXT_MAX_WORDS:
+        return None
+
+    features = {"category": "other", "mood": "casual", "time_of_day": "anytime"}
+    for word in words:
+        word = word.strip(".,!?:;()\"'")
+        if word in _CATEGORIES:
+            features["category"] = word
+        elif word in _SHORT_TEXT_CATEGORIES:
+            features["category"] = _SHORT_TEXT_CATEGORIES[word]
+        if word in _MOODS:
+            features["mood"] = word
+        if word in _TIMES:
+            features["time_of_day"] = word
+        elif word in _SHORT_TEXT_TIMES:
+            features["time_of_day"] = _SHORT_TEXT_TIMES[word]
+
+    return _features_to_vector(features, text)
+
+
+def _content_hash(text: str) -> str:
+    """
+    Hash of the text with case and whitespace normalized, so "Blue Bottle Cafe "
+    and "blue bottle cafe" share a cache entry — _features_to_vector already
+    lowercases and splits on whitespace, so their vectors would be identical.
+    """
+    return xxhash.xxh3_128_hexdigest(" ".join(text.lower().split()).encode())
+
+
+def _cache_key(text: str) -> str:
+    return f"{EMBEDDING_CACHE_PREFIX}{_content_hash(text)}"
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests that arrive close together (e.g. a burst of
+    card drops) into a single generate_embeddings call.
+
+    Callers await submit(text); a background task drains up to max_size texts,
+    or whatever arrived within max_wait_ms of the first one, per batch. Batches
+    run concurrently — claude_service's semaphore bounds the Claude calls.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_BATCH_MAX_SIZE, max_wait_ms: int = EMBEDDING_BATCH_MAX_WAIT_MS):
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        # Strong references to in-flight batches, so they aren't garbage-collected
+        self._batches: set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> np.ndarray:
+        """Queue a text for the next batch and wait for its embedding."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._embed_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _embed_batch(self, batch: list[tuple[str, asyncio.Future]]):
+        # Identical texts in the same window share one embedding
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            if len(texts) == 1:
+                vectors = [await generate_embedding(texts[0])]
+            else:
+                vectors = await generate_embeddings(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if future.done():
+                continue
+            if by_text[text] is None:
+                future.set_exception(RuntimeError("Embedding generation failed"))
+            else:
+                future.set_result(by_text[text])
+
+
+batcher = EmbeddingBatcher()
+
+
+def _features_to_vector(features: dict, raw_text: str) -> np.ndarray:
     """
     Convert structured semantic features into a fixed-dimension vector.
     Uses deterministic hashing so the same features always produce the same vector.
-    """
-    vec = np.zeros(EMBEDDING_DIM, dtype=np.float32)
 
-    # Category encoding (dims 0-31)
-    categories = ["hotel", "flight", "restaurant", "activity", "transit", "note", "other", "unknown"]
+    Parsing (vocabulary lookups, tokens and their weights) happens here; the
+    numeric work is in _embed_tokens.
+    """
     cat = features.get("category", "other").lower()
-    cat_idx = categories.index(cat) if cat in categories else 7
-    # One-hot with spread
-    for i in range(4):
-        vec[cat_idx * 4 + i] = 1.0
-
-    # Location keywords (dims 32-95) — hash each keyword into this range
-    for kw in features.get("location_keywords", []):
-        h = int(hashlib.md5(kw.lower().encode()).hexdigest(), 16)
-        idx = 32 + (h % 64)
-        vec[idx] += 1.0
-
-    # Vibe keywords (dims 96-175) — hash each keyword into this range
-    for kw in features.get("vibe_keywords", []):
-        h = int(hashlib.md5(kw.lower().encode()).hexdigest(), 16)
-        idx = 96 + (h % 80)
-        vec[idx] += 1.0
-
-    # Numeric features (dims 176-185)
-    vec[176] = float(features.get("price_level", 0)) / 5.0
-    vec[177] = float(features.get("quality_signal", 0)) / 5.0
-
-    # Mood encoding (dims 186-209)
-    moods = ["relaxing", "adventurous", "romantic", "family", "cultural", "party", "business", "casual"]
     mood = features.get("mood", "casual").lower()
-    mood_idx = moods.index(mood) if mood in moods else 7
-    for i in range(3):
-        vec[186 + mood_idx * 3 + i] = 1.0
-
-    # time_of_day encoding (dims 210-240)
-    times = ["morning", "afternoon", "evening", "night", "anytime", "unknown"]
     time_of_day = features.get("time_of_day", "anytime").lower()
-    if time_of_day in times:
-        time_idx = times.index(time_of_day)
-        for i in range(5):
-            vec[210 + time_idx * 5 + i] = 1.0
 
-    # Raw text hash for fine-grained differentiation (dims 241-255)
-    words = raw_text.lower().split()
-    for word in words:
-        h = int(hashlib.md5(word.encode()).hexdigest(), 16)
-        idx = 241 + (h % 15)
-        vec[idx] += 0.3
+    # Tokens are namespaced so e.g. the category "hotel" and the keyword "hotel" differ
+    tokens = [
+        f"category:{cat if cat in _CATEGORIES else _CATEGORIES[-1]}",
+        f"mood:{mood if mood in _MOODS else _MOODS[-1]}",
+        "price",
+        "quality",
+    ]
+    weights = [
+        CATEGORY_WEIGHT,
+        MOOD_WEIGHT,
+        float(features.get("price_level", 0)) / 5.0,
+        float(features.get("quality_signal", 0)) / 5.0,
+    ]
+    if time_of_day in _TIMES:
+        tokens.append(f"time:{time_of_day}")
+        weights.append(TIME_WEIGHT)
+    for namespace, key in (("loc", "location_keywords"), ("vibe", "vibe_keywords")):
+        for kw in features.get(key, []):
+            tokens.append(f"{namespace}:{kw.lower()}")
+            weights.append(KEYWORD_WEIGHT)
+    for word in raw_text.lower().split():
+        tokens.append(f"word:{word}")
+        weights.append(WORD_WEIGHT)
+
+    return _embed_tokens(
+        _hash_tokens(tokens, seed=0),
+        _hash_tokens(tokens, seed=1),
+        np.asarray(weights, dtype=np.float32),
+    )
+
+
+def _hash_tokens(tokens: list[str], seed: int) -> np.ndarray:
+    """Component row for each token under one of two independent hash seeds."""
+    return np.fromiter(
+        (xxhash.xxh3_64_intdigest(t.encode(), seed=seed) % EMBEDDING_COMPONENTS for t in tokens),
+        dtype=np.int64,
+        count=len(tokens),
+    )
+
+
+def _embed_tokens(rows_a: np.ndarray, rows_b: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Weighted sum of each token's two component vectors, L2-normalized.
+    Two rows per token keep collisions between different tokens rare.
+    """
+    vec = 0.5 * (weights @ _COMPONENTS[rows_a] + weights @ _COMPONENTS[rows_b])
 
     # Normalize the vector
     norm = np.linalg.norm(vec)
     if norm > 0:
         vec = vec / norm
 
-    return vec.tolist()
+    return vec
@@ -0,0 +1,111 @@
+"""
+Local Embedder — Optional on-device text embeddings via ONNX Runtime.
+
+When ONNX_EMBEDDER_PATH points at a directory holding an exported sentence
+embedding model (model.onnx + tokenizer.json, e.g. an int8-quantized
+bge-small-en-v1.5), cards are embedded locally in milliseconds instead of
+through a Claude feature-extraction call. Without it, or without onnxruntime
+and tokenizers installed, embedding_service keeps using Claude.
+
+Vectors are projected down to EMBEDDING_DIM with a fixed random matrix so the
+Redis schema and in-process stores don't change. They live in a different
+space from Claude feature vectors — don't mix the two in one deployment.
+"""
+
+import os
+import asyncio
+import numpy as np
+from services.redis_service import EMBEDDING_DIM
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+except ImportError:
+    ort = None
+    Tokenizer = None
+
+
+MAX_TOKENS = 512
+# Fixed seed — every process must project into the same 256-d space
+PROJECTION_SEED = 0
+
+_session = None
+_tokenizer = None
+_projection: np.ndarray | None = None
+
+
+def available() -> bool:
+    """Whether the local model was loaded at startup (see load)."""
+    return _session is not None
+
+
+async def load():
+    """
+    Load the model if ONNX_EMBEDDER_PATH is set (once, at app startup).
+    Building the ONNX session takes a while, so it runs off the event loop.
+    """
+    # Read here, not at import — main.py loads .env after importing the services
+    model_dir = os.getenv("ONNX_EMBEDDER_PATH")
+    if not model_dir or _session is not None:
+        return
+    if ort is None or Tokenizer is None:
+        print("⚠️ ONNX_EMBEDDER_PATH is set but onnxruntime/tokenizers aren't installed — using Claude")
+        return
+    await asyncio.to_thread(_load_sync, model_dir)
+
+
+def _load_sync(model_dir: str):
+    global _session, _tokenizer
+    try:
+        tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        tokenizer.enable_truncation(MAX_TOKENS)
+        tokenizer.enable_padding()
+        session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            providers=["CPUExecutionProvider"],
+        )
+    except Exception as e:
+        print(f"⚠️ Local embedder unavailable, using Claude: {e}")
+        return
+
+    _tokenizer, _session = tokenizer, session
+    print(f"✅ Local embedder loaded from {model_dir}")
+
+
+async def embed(texts: list[str]) -> list[np.ndarray]:
+    """Embed texts with the local model — unit-length float32 vectors, in order."""
+    # CPU-bound — run it off the event loop (ONNX Runtime releases the GIL)
+    vecs = await asyncio.to_thread(_embed_sync, texts)
+    return list(vecs)
+
+
+def _embed_sync(texts: list[str]) -> np.ndarray:
+    encodings = _tokenizer.encode_batch(texts)
+    input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+    feeds = {
+        "input_ids": input_ids,
+        "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+        "token_type_ids": np.zeros_like(input_ids),
+    }
+    input_names = {i.name for i in _session.get_inputs()}
+
+    hidden = _session.run(None, {name: v for name, v in feeds.items() if name in input_names})[0]
+    if hidden.ndim == 3:
+        # Token states — BGE models pool on the [CLS] token
+        hidden = hidden[:, 0]
+
+    vecs = _normalize(hidden.astype(np.float32)) @ _get_projection(hidden.shape[-1])
+    return _normalize(vecs)
+
+
+def _get_projection(hidden_dim: int) -> np.ndarray:
+    """Gaussian random projection hidden_dim → EMBEDDING_DIM; roughly preserves cosine."""
+    global _projection
+    if _projection is None or _projection.shape[0] != hidden_dim:
+        rng = np.random.default_rng(PROJECTION_SEED)
+        _projection = (rng.standard_normal((hidden_dim, EMBEDDING_DIM)) / np.sqrt(EMBEDDING_DIM)).astype(np.float32)
+    return _projection
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True).clip(1e-12)
@@ -9,6 +9,7 @@ import os
 import json
 import numpy as np
 import redis
+import redis.asyncio as aioredis
 from redis.commands.search.field import VectorField, TextField, TagField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
@@ -17,12 +18,67 @@ from redis.commands.search.query import Query
 EMBEDDING_DIM = 256
 INDEX_NAME = "orbit_cards_idx"
 KEY_PREFIX = "card:"
-
-
-def get_redis_client():
-    """Get a Redis client from environment config."""
-    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-    return redis.from_url(redis_url, decode_responses=False)
+# Cards are HASH documents with the embedding as raw int8 vector bytes. init_redis
+# rebuilds an index left over from an older layout (FLAT, JSON, FLOAT32) and
+# rewrites the cards stored in it
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_RUNTIME = 10
+# card_id TAG lets queries filter by card; init_redis adds it to older indexes
+# Above this many cards, gravity asks Redis for each card's nearest neighbours only
+GRAVITY_KNN_MIN_CARDS = 64
+GRAVITY_KNN_NEIGHBORS = 16
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+
+_pool: redis.ConnectionPool | None = None
+_async_pool: aioredis.ConnectionPool | None = None
+_async_client: aioredis.Redis | None = None
+
+
+def get_redis_client() -> redis.Redis:
+    """
+    Get a Redis client from environment config.
+    Clients share one connection pool; connections go back to it after each command.
+    """
+    global _pool
+    if _pool is None:
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        _pool = redis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            decode_responses=False,
+        )
+    return redis.Redis(connection_pool=_pool)
+
+
+def get_async_redis() -> aioredis.Redis:
+    """
+    Get the shared asyncio Redis client.
+    All callers reuse one connection pool, so there is no connect/close per request.
+    """
+    global _async_pool, _async_client
+    if _async_client is None:
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        _async_pool = aioredis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            decode_responses=False,
+        )
+        _async_client = aioredis.Redis(connection_pool=_async_pool)
+    return _async_client
+
+
+async def close_async_redis():
+    """Close the shared asyncio client and both connection pools (app shutdown)."""
+    global _pool, _async_pool, _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        await _async_pool.disconnect()
+    if _pool is not None:
+        _pool.disconnect()
+    _pool = None
+    _async_pool = None
+    _async_client = None
 
 
 def ensure_index(client):
@@ -33,115 +89,362 @@ def ensure_index(client):
     except Exception:
         pass
 
+    _create_index(client, INDEX_NAME, KEY_PREFIX)
+
+
+def _create_index(client, name: str, prefix: str):
     schema = (
-        TextField("$.title", as_name="title"),
-        TextField("$.category", as_name="category"),
-        TextField("$.summary", as_name="summary"),
+        TextField("title"),
+        TextField("category"),
+        TextField("summary"),
+        TagField("card_id"),
         VectorField(
-            "$.embedding",
-            "FLAT",
+            "embedding",
+            "HNSW",
             {
-                "TYPE": "FLOAT32",
+                # INT8 vectors need Redis 8.0+ (Query Engine); older versions reject the index
+                "TYPE": "INT8",
                 "DIM": EMBEDDING_DIM,
                 "DISTANCE_METRIC": "COSINE",
+                "M": HNSW_M,
+                "EF_CONSTRUCTION": HNSW_EF_CONSTRUCTION,
             },
-            as_name="embedding",
         ),
     )
 
     definition = IndexDefinition(
-        prefix=[KEY_PREFIX],
-        index_type=IndexType.JSON,
+        prefix=[prefix],
+        index_type=IndexType.HASH,
     )
 
-    client.ft(INDEX_NAME).create_index(schema, definition=definition)
+    client.ft(name).create_index(schema, definition=definition)
 
 
-async def store_card_embedding(card_id: str, title: str, category: str, summary: str, embedding: list[float]):
-    """Store a card's data and embedding in Redis."""
+def _probe_index_layout(client):
+    """
+    Create and drop a throwaway index with ensure_index's layout over a prefix
+    no keys use. Raises redis.ResponseError if this Redis can't build it.
+    """
+    probe = client.ft(f"{INDEX_NAME}_probe")
+    try:
+        probe.dropindex(delete_documents=False)  # Left over from an interrupted probe
+    except redis.ResponseError:
+        pass
+    _create_index(client, f"{INDEX_NAME}_probe", "orbit:index-probe:")
+    probe.dropindex(delete_documents=False)
+
+
+def init_redis():
+    """
+    Create the index once at app startup. Store and search assume it exists;
+    if Redis was down at startup, creating it later still indexes existing cards.
+
+    An existing index with an outdated layout would silently fail to index new
+    cards, so it is dropped (documents are kept) and rebuilt — once a probe index
+    shows this Redis can build the new layout. An index without the card_id tag
+    gets it added, and existing cards are tagged. A missing index may have been
+    dropped by hand or by a failed rebuild, so cards in an older layout are
+    migrated then too.
+    """
     client = get_redis_client()
-    ensure_index(client)
+    try:
+        info = client.ft(INDEX_NAME).info()
+    except redis.ResponseError:
+        ensure_index(client)  # No index yet
+        _migrate_legacy_cards(client)
+        _backfill_card_ids(client)
+        return
+
+    problems = _index_problems(info)
+    if problems:
+        print(f"🚨 Redis index {INDEX_NAME} is outdated ({'; '.join(problems)}) — rebuilding it")
+        try:
+            _probe_index_layout(client)
+        except redis.ResponseError as e:
+            # Dropping first would leave no index at all; keep the old one serving
+            print(f"🚨 This Redis can't build the new index, keeping the outdated one: {e}")
+            return
+        client.ft(INDEX_NAME).dropindex(delete_documents=False)
+        ensure_index(client)
+        _migrate_legacy_cards(client)
+        _backfill_card_ids(client)
+    elif not _has_attribute(info, "card_id"):
+        print(f"⚠️ Redis index {INDEX_NAME} has no card_id tag — adding it")
+        client.ft(INDEX_NAME).alter_schema_add([TagField("card_id")])
+        _backfill_card_ids(client)
+
+
+def _migrate_legacy_cards(client):
+    """
+    Rewrite cards stored in an older layout — RedisJSON documents, or hashes with
+    float32 vector bytes — as int8 HASH cards, so the rebuilt index covers them.
+    """
+    migrated = 0
+    for key in client.scan_iter(match=f"{KEY_PREFIX}*", count=1000):
+        key_type = client.type(key)
+        if key_type == b"ReJSON-RL":
+            doc = client.json().get(key)
+            if not doc or "embedding" not in doc:
+                continue
+            # int8 codes with their scale, or plain float lists (no scale)
+            embedding = np.asarray(doc["embedding"], dtype=np.float32) * doc.get("scale", 1.0)
+            title, category, summary = (doc.get(f, "") for f in ("title", "category", "summary"))
+        elif key_type == b"hash":
+            raw = client.hget(key, "embedding")
+            if raw is None or len(raw) != EMBEDDING_DIM * 4:
+                continue  # Missing, or already int8
+            embedding = np.frombuffer(raw, dtype=np.float32)
+            title, category, summary = (
+                (v or b"").decode() for v in client.hmget(key, "title", "category", "summary")
+            )
+        else:
+            continue
+
+        card_id = key.decode()[len(KEY_PREFIX):]
+        pipe = client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=_card_mapping(card_id, title, category, summary, embedding))
+        pipe.execute()
+        migrated += 1
+
+    if migrated:
+        print(f"✅ Migrated {migrated} cards to int8 hashes")
+
+
+def _has_attribute(info: dict, name: str) -> bool:
+    return any(_info_pairs(attribute).get("identifier") == name for attribute in info.get("attributes", []))
+
 
-    key = f"{KEY_PREFIX}{card_id}"
+def _backfill_card_ids(client):
+    """Set card_id on cards stored before the tag existed (one-off migration at startup)."""
+    pipe = client.pipeline(transaction=False)
+    for key in client.scan_iter(match=f"{KEY_PREFIX}*", count=1000, _type="HASH"):
+        pipe.hsetnx(key, "card_id", key.decode()[len(KEY_PREFIX):])
+        if len(pipe) >= 1000:
+            pipe.execute()
+    pipe.execute()
 
-    card_data = {
+
+def _index_problems(info: dict) -> list[str]:
+    """Ways an existing index's FT.INFO differs from the layout ensure_index creates."""
+    definition = _info_pairs(info.get("index_definition", []))
+    attributes = {}
+    for attribute in info.get("attributes", []):
+        attribute = _info_pairs(attribute)
+        attributes[attribute.get("identifier")] = attribute
+
+    problems = []
+    if definition.get("key_type") != "HASH":
+        problems.append(f"indexes {definition.get('key_type')} documents, not HASH")
+    vector = attributes.get("embedding")
+    if vector is None or vector.get("type") != "VECTOR":
+        problems.append("no embedding vector field")
+    else:
+        # Older RediSearch versions don't report vector details; only compare what's there
+        for key, expected in (("algorithm", "HNSW"), ("data_type", "INT8")):
+            if key in vector and str(vector[key]).upper() != expected:
+                problems.append(f"embedding {key} is {vector[key]}, not {expected}")
+    return problems
+
+
+def _info_pairs(values: list) -> dict:
+    """FT.INFO's flat [key, value, ...] lists as a dict with lowercase str keys."""
+    decoded = [v.decode() if isinstance(v, bytes) else v for v in values]
+    return {str(k).lower(): v for k, v in zip(decoded[::2], decoded[1::2])}
+
+
+def quantize_int8(embedding: np.ndarray) -> tuple[np.ndarray, float]:
+    """
+    Symmetric per-vector int8 quantization: embedding ≈ codes * scale.
+    The scale is chosen so codes * scale is exactly unit-length, which lets
+    readers take cosine similarity as a plain dot product.
+    """
+    vec = np.asarray(embedding, dtype=np.float32)
+    step = float(np.abs(vec).max()) / 127.0
+    if step == 0.0:
+        return np.zeros(vec.shape, dtype=np.int8), 1.0
+    codes = np.round(vec / step).astype(np.int8)
+    return codes, 1.0 / float(np.linalg.norm(codes.astype(np.float32)))
+
+
+async def store_card_embedding(card_id: str, title: str, category: str, summary: str, embedding: np.ndarray):
+    """Store a card's data and its int8-quantized embedding (raw bytes) in a Redis hash."""
+    await get_async_redis().hset(
+        f"{KEY_PREFIX}{card_id}", mapping=_card_mapping(card_id, title, category, summary, embedding)
+    )
+
+
+async def store_card_embeddings_bulk(cards: list[dict]):
+    """
+    Store many cards ({id, title, category, summary, embedding}) like
+    store_card_embedding, pipelined into a single round-trip.
+    """
+    if not cards:
+        return
+
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        for card in cards:
+            pipe.hset(
+                f"{KEY_PREFIX}{card['id']}",
+                mapping=_card_mapping(card["id"], card["title"], card["category"], card["summary"], card["embedding"]),
+            )
+        await pipe.execute()
+
+
+def _card_mapping(card_id: str, title: str, category: str, summary: str, embedding: np.ndarray) -> dict:
+    codes, scale = quantize_int8(embedding)
+    return {
+        "card_id": card_id,
         "title": title,
         "category": category,
         "summary": summary,
-        "embedding": embedding,
+        "embedding": codes.tobytes(),
+        "scale": scale,
     }
 
-    client.json().set(key, "$", card_data)
-    client.close()
+
+async def _get_quantized(card_ids: list[str]) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Fetch int8 codes and scales for several cards in one pipelined round-trip.
+    Returns (ids, (N, D) int8 codes, (N,) float32 scales) for the cards that have an embedding.
+    """
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        for card_id in card_ids:
+            pipe.hmget(f"{KEY_PREFIX}{card_id}", "embedding", "scale")
+        raw = await pipe.execute(raise_on_error=False)
+
+    ids, codes, scales = [], [], []
+    for card_id, fields in zip(card_ids, raw):
+        # Skips missing cards, errors from pre-HASH JSON documents, and pre-int8 float32 bytes
+        if not isinstance(fields, list) or fields[0] is None or len(fields[0]) != EMBEDDING_DIM:
+            continue
+        ids.append(card_id)
+        codes.append(np.frombuffer(fields[0], dtype=np.int8))
+        scales.append(float(fields[1]))
+
+    if not ids:
+        return [], np.empty((0, EMBEDDING_DIM), dtype=np.int8), np.empty(0, dtype=np.float32)
+    return ids, np.stack(codes), np.asarray(scales, dtype=np.float32)
+
+
+async def get_card_embeddings(card_ids: list[str]) -> dict[str, np.ndarray]:
+    """
+    Fetch the stored embeddings of several cards in one pipelined round-trip.
+    Values are dequantized to unit-length float32 vectors. Cards without an embedding are left out.
+    """
+    if not card_ids:
+        return {}
+
+    ids, codes, scales = await _get_quantized(card_ids)
+    vecs = codes.astype(np.float32) * scales[:, None]
+    return dict(zip(ids, vecs))
 
 
 async def get_similarity_pairs(card_ids: list[str]) -> list[dict]:
     """
-    Compute pairwise similarity between all given cards using their stored embeddings.
+    Compute pairwise similarity between the given cards using their stored embeddings.
     Returns a list of {card_a, card_b, similarity} pairs.
+
+    Up to GRAVITY_KNN_MIN_CARDS cards this is every pair, like CardStore. Above
+    it, only each card's approximate nearest neighbours within the set come back
+    (see _knn_similarity_pairs), so pairs of unrelated cards are missing.
     """
     if len(card_ids) < 2:
         return []
 
-    client = get_redis_client()
-
-    # Retrieve all embeddings
-    embeddings = {}
-    for card_id in card_ids:
-        key = f"{KEY_PREFIX}{card_id}"
+    # Retrieve all embeddings in one round-trip
+    ids, codes, scales = await _get_quantized(list(dict.fromkeys(card_ids)))
+    if len(ids) < 2:
+        return []
+    if len(ids) > GRAVITY_KNN_MIN_CARDS:
         try:
-            data = client.json().get(key, "$.embedding")
-            if data and len(data) > 0:
-                embeddings[card_id] = np.array(data[0], dtype=np.float32)
-        except Exception:
-            continue
+            pairs = await _knn_similarity_pairs(ids, codes, GRAVITY_KNN_NEIGHBORS)
+        except Exception as e:
+            print(f"⚠️ KNN gravity failed, computing all pairs instead: {e}")
+            pairs = []
+        # Nothing back means the index can't see these cards (e.g. not indexed yet) — not that none are similar
+        if pairs:
+            return pairs
+
+    return similarity_pairs_from_codes(ids, codes, scales)
 
-    client.close()
 
-    # Compute pairwise cosine similarity
-    pairs = []
-    ids = list(embeddings.keys())
+def similarity_pairs_from_codes(ids: list[str], codes: np.ndarray, scales: np.ndarray) -> list[dict]:
+    """Every pair's similarity from one integer GEMM over int8 codes (also CardStore's path)."""
+    # Pairwise cosine similarity — an integer GEMM over the codes (int32 accumulation;
+    # int16 would overflow at 127² × 256), rescaled to the unit-length dot product
+    Q = codes.astype(np.int32)
+    sims = (Q @ Q.T) * np.outer(scales, scales)
+    rows_a, rows_b = np.triu_indices(len(ids), k=1)
 
-    for i in range(len(ids)):
-        for j in range(i + 1, len(ids)):
-            vec_a = embeddings[ids[i]]
-            vec_b = embeddings[ids[j]]
+    return [
+        {"card_a": ids[i], "card_b": ids[j], "similarity": float(sims[i, j])}
+        for i, j in zip(rows_a.tolist(), rows_b.tolist())
+    ]
 
-            # Cosine similarity
-            dot = np.dot(vec_a, vec_b)
-            norm_a = np.linalg.norm(vec_a)
-            norm_b = np.linalg.norm(vec_b)
 
-            if norm_a > 0 and norm_b > 0:
-                similarity = float(dot / (norm_a * norm_b))
-            else:
-                similarity = 0.0
+async def _knn_similarity_pairs(ids: list[str], codes: np.ndarray, k: int) -> list[dict]:
+    """
+    Similarity pairs for a large card set, computed inside Redis: one KNN query per
+    card, pipelined into one round-trip, so only (card_id, score) pairs come back
+    instead of all N² pairs.
+
+    Queries search the whole index and neighbours outside the set are dropped
+    here — a card_id tag filter per query would make the request O(N²) bytes.
+    A card can therefore get fewer than k neighbours from the set.
+    """
+    wanted = set(ids)
+    # k + 1 — every card is its own nearest neighbour
+    q = (
+        Query(f"*=>[KNN {k + 1} @embedding $query_vec AS score]")
+        .sort_by("score")
+        .return_fields("card_id", "score")
+        .paging(0, k + 1)
+        .dialect(2)
+    )
 
-            pairs.append({
-                "card_a": ids[i],
-                "card_b": ids[j],
-                "similarity": similarity,
-            })
+    # Raw FT.SEARCH commands — redis-py's async search helper can't be queued on a pipeline
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        for row in codes:
+            # COSINE ignores the scale, so the codes alone are the query
+            pipe.execute_command("FT.SEARCH", INDEX_NAME, *q.get_args(), "PARAMS", 2, "query_vec", row.tobytes())
+        results = await pipe.execute()
+
+    pairs = {}
+    for card_a, res in zip(ids, results):
+        # Raw FT.SEARCH reply: [total, key, [field, value, ...], key, [...], ...]
+        for fields in res[2::2]:
+            doc = dict(zip(fields[::2], fields[1::2]))
+            card_b = doc[b"card_id"].decode()
+            if card_b != card_a and card_b in wanted:
+                # COSINE distance is 1 - cosine similarity
+                pairs[tuple(sorted((card_a, card_b)))] = 1.0 - float(doc[b"score"])
 
-    return pairs
+    return [
+        {"card_a": card_a, "card_b": card_b, "similarity": similarity}
+        for (card_a, card_b), similarity in pairs.items()
+    ]
 
 
-async def search_similar(query_embedding: list[float], top_k: int = 10) -> list[dict]:
+async def search_similar(query_embedding: np.ndarray, top_k: int = 10) -> list[dict]:
     """Search for cards similar to the given embedding."""
     client = get_redis_client()
-    ensure_index(client)
 
-    query_bytes = np.array(query_embedding, dtype=np.float32).tobytes()
+    # The index is INT8; COSINE ignores the scale, so the codes alone are the query
+    query_bytes = quantize_int8(query_embedding)[0].tobytes()
+    # The candidate list must be at least as wide as k for HNSW to return k results
+    ef_runtime = max(top_k, HNSW_EF_RUNTIME)
 
     q = (
-        Query(f"*=>[KNN {top_k} @embedding $query_vec AS score]")
+        Query(f"*=>[KNN {top_k} @embedding $query_vec EF_RUNTIME $ef_runtime AS score]")
         .sort_by("score")
         .return_fields("title", "category", "summary", "score")
         .dialect(2)
     )
 
-    results = client.ft(INDEX_NAME).search(q, query_params={"query_vec": query_bytes})
-    client.close()
+    results = client.ft(INDEX_NAME).search(
+        q, query_params={"query_vec": query_bytes, "ef_runtime": ef_runtime}
+    )
 
     return [
         {
@@ -157,9 +460,6 @@ async def search_similar(query_embedding: list[float], top_k: int = 10) -> list[
 async def check_redis_connection() -> bool:
     """Check if Redis is reachable."""
     try:
-        client = get_redis_client()
-        client.ping()
-        client.close()
-        return True
+        return await get_async_redis().ping()
     except Exception:
         return False
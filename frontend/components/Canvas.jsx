@@ -29,7 +29,7 @@ import BudgetMagnetNode from "./BudgetMagnet";
 import InputBar from "./InputBar";
 import Toolbar from "./Toolbar";
 import { useGravity } from "@/hooks/useGravity";
-import { generateCard, applyMagnet, healthCheck, suggestNext, exportItinerary } from "@/lib/api";
+import { generateCard, applyMagnet, healthCheck, suggestNext, streamItinerary } from "@/lib/api";
 
 // Register custom node types
 const nodeTypes = {
@@ -359,8 +359,7 @@ function CanvasInner() {
 
         setIsExporting(true);
         try {
-            const { markdown } = await exportItinerary(activeCards);
-            setExportContent(markdown);
+            await streamItinerary(activeCards, setExportContent);
         } catch (err) {
             console.error("Export failed:", err);
             setExportContent("Failed to generate itinerary.");
@@ -675,7 +674,7 @@ function CanvasInner() {
                             }}
                             onClick={(e) => e.stopPropagation()}
                         >
-                            {isExporting ? (
+                            {isExporting && !exportContent ? (
                                 <div style={{ textAlign: "center", padding: "40px 0" }}>
                                     <div style={{ fontSize: 48, marginBottom: 16 }}>✨</div>
                                     <h2 style={{ fontSize: 20, fontWeight: 600, color: "var(--text-primary)" }}>
@@ -688,7 +687,7 @@ function CanvasInner() {
                             ) : (
                                 <>
                                     <button
-                                        onClick={() => setExportContent(null)}
+                                        onClick={() => !isExporting && setExportContent(null)}
                                         style={{
                                             position: "absolute",
                                             top: 24,
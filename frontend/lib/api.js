@@ -73,6 +73,31 @@ export async function exportItinerary(cards) {
     return res.json();
 }
 
+export async function streamItinerary(cards, onText) {
+    const res = await fetch(`${API_URL}/api/export/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ cards }),
+    });
+
+    if (!res.ok) {
+        throw new Error("Export failed");
+    }
+
+    // Hand the Markdown so far to the caller as each chunk arrives
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let markdown = "";
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        markdown += decoder.decode(value, { stream: true });
+        onText(markdown);
+    }
+
+    return markdown;
+}
+
 export async function healthCheck() {
     try {
         const res = await fetch(`${API_URL}/health`);